@@ -1,8 +1,19 @@
-import sqlite3
+from storage import storage_from_env as _storage_from_env
+
+
+_storage = _storage_from_env()
+
+GEO_CELL_DEGREES = 0.5
+CHANGES_RETAINED = 100_000
+
+CUSTOMER_COLUMNS = ("customer_id", "name", "phone", "email")
+_SNAPSHOT_COLUMNS = "p.price, p.stock_quantity, p.latitude, p.longitude, CAST(strftime('%s', p.created_at) AS REAL), p.category, p.item"
+
+PRODUCT_COLUMNS = ("product_id", "name", "price", "stock_quantity", "latitude", "longitude", "category", "item", "description", "owner_id", "created_at")
 
 
 def create_database():
-    with sqlite3.connect("store.db") as con:
+    with _storage.connect() as con:
         cur = con.cursor()
 
         cur.execute("""
@@ -31,13 +42,204 @@ def create_database():
             )
         """)
 
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS owner_category_stats (
+                owner_id INTEGER NOT NULL,
+                category TEXT NOT NULL,
+                product_count INTEGER NOT NULL,
+                total_stock INTEGER NOT NULL,
+                stock_value_cents INTEGER NOT NULL,
+                price_sum_cents INTEGER NOT NULL,
+                min_price REAL NOT NULL,
+                max_price REAL NOT NULL,
+                PRIMARY KEY (owner_id, category)
+            )
+        """)
+
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS item_region_stats (
+                item TEXT NOT NULL,
+                lat_cell INTEGER NOT NULL,
+                lon_cell INTEGER NOT NULL,
+                product_count INTEGER NOT NULL,
+                total_stock INTEGER NOT NULL,
+                price_sum_cents INTEGER NOT NULL,
+                min_price REAL NOT NULL,
+                PRIMARY KEY (item, lat_cell, lon_cell)
+            )
+        """)
+
+        # min/max recomputation on delete walks these indexes instead of the whole products table
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_products_owner_category_price ON products (owner_id, category, price)")
+        cur.execute(f"CREATE INDEX IF NOT EXISTS idx_products_item_cell_price ON products (item, {_geo_cell('latitude', 90)}, {_geo_cell('longitude', 180)}, price)")
+
+        cur.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS products_stats_insert AFTER INSERT ON products
+            BEGIN
+                {_stats_add_sql("NEW")}
+            END
+        """)
+
+        cur.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS products_stats_delete AFTER DELETE ON products
+            BEGIN
+                {_stats_remove_sql("OLD")}
+            END
+        """)
+
+        cur.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS products_stats_update AFTER UPDATE OF price, stock_quantity, latitude, longitude, category, item, owner_id ON products
+            BEGIN
+                {_stats_remove_sql("OLD")}
+                {_stats_add_sql("NEW")}
+            END
+        """)
+
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS changes (
+                change_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                table_name TEXT NOT NULL,
+                row_id INTEGER NOT NULL,
+                operation TEXT NOT NULL,
+                payload TEXT,
+                changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+
+        for table_name, columns in (("customers", CUSTOMER_COLUMNS), ("products", PRODUCT_COLUMNS)):
+            for operation, row in (("insert", "NEW"), ("update", "NEW"), ("delete", "OLD")):
+                cur.execute(f"""
+                    CREATE TRIGGER IF NOT EXISTS {table_name}_changes_{operation} AFTER {operation.upper()} ON {table_name}
+                    BEGIN
+                        {_change_log_sql(table_name, columns, operation, row)}
+                    END
+                """)
+
+        # keep only the newest CHANGES_RETAINED entries; readers further behind get 410 or reload in full
+        cur.execute("DROP TRIGGER IF EXISTS changes_retention")
+        cur.execute(f"""
+            CREATE TRIGGER changes_retention AFTER INSERT ON changes
+            BEGIN
+                DELETE FROM changes WHERE change_id <= NEW.change_id - {CHANGES_RETAINED};
+            END
+        """)
+        cur.execute("DELETE FROM changes WHERE change_id <= (SELECT MAX(change_id) FROM changes) - ?", (CHANGES_RETAINED,))
+
         con.commit()
 
+        cur.execute("SELECT EXISTS(SELECT 1 FROM products), EXISTS(SELECT 1 FROM owner_category_stats)")
+        has_products, has_stats = cur.fetchone()
+
+    if has_products and not has_stats:
+        summaries_rebuild()
+
     print("Database and tables: customers and products created successfully (or already exist)")
 
 
+def _geo_cell(column: str, offset: int) -> str:
+    # shifting into the positive range makes the INTEGER cast behave like floor()
+    return f"CAST(({column} + {offset}) / {GEO_CELL_DEGREES} AS INTEGER)"
+
+
+def _cents(price: str) -> str:
+    # sums are kept in integer cents so repeated add/subtract in the triggers cannot drift
+    return f"CAST(ROUND({price} * 100) AS INTEGER)"
+
+
+def geo_cell(latitude: float, longitude: float) -> tuple[int, int]:
+    return int((latitude + 90) / GEO_CELL_DEGREES), int((longitude + 180) / GEO_CELL_DEGREES)
+
+
+def _stats_add_sql(row: str) -> str:
+    price_cents = _cents(f"{row}.price")
+    return f"""
+        INSERT INTO owner_category_stats (owner_id, category, product_count, total_stock, stock_value_cents, price_sum_cents, min_price, max_price)
+        VALUES ({row}.owner_id, {row}.category, 1, {row}.stock_quantity, {price_cents} * {row}.stock_quantity, {price_cents}, {row}.price, {row}.price)
+        ON CONFLICT (owner_id, category) DO UPDATE SET
+            product_count = product_count + 1,
+            total_stock = total_stock + excluded.total_stock,
+            stock_value_cents = stock_value_cents + excluded.stock_value_cents,
+            price_sum_cents = price_sum_cents + excluded.price_sum_cents,
+            min_price = MIN(min_price, excluded.min_price),
+            max_price = MAX(max_price, excluded.max_price);
+
+        INSERT INTO item_region_stats (item, lat_cell, lon_cell, product_count, total_stock, price_sum_cents, min_price)
+        VALUES ({row}.item, {_geo_cell(f"{row}.latitude", 90)}, {_geo_cell(f"{row}.longitude", 180)}, 1, {row}.stock_quantity, {price_cents}, {row}.price)
+        ON CONFLICT (item, lat_cell, lon_cell) DO UPDATE SET
+            product_count = product_count + 1,
+            total_stock = total_stock + excluded.total_stock,
+            price_sum_cents = price_sum_cents + excluded.price_sum_cents,
+            min_price = MIN(min_price, excluded.min_price);
+    """
+
+
+def _stats_remove_sql(row: str) -> str:
+    lat_cell = _geo_cell(f"{row}.latitude", 90)
+    lon_cell = _geo_cell(f"{row}.longitude", 180)
+    owner_group = f"owner_id = {row}.owner_id AND category = {row}.category"
+    region_group = f"item = {row}.item AND {_geo_cell('latitude', 90)} = {lat_cell} AND {_geo_cell('longitude', 180)} = {lon_cell}"
+    price_cents = _cents(f"{row}.price")
+
+    return f"""
+        UPDATE owner_category_stats SET
+            product_count = product_count - 1,
+            total_stock = total_stock - {row}.stock_quantity,
+            stock_value_cents = stock_value_cents - {price_cents} * {row}.stock_quantity,
+            price_sum_cents = price_sum_cents - {price_cents},
+            min_price = CASE WHEN {row}.price > min_price THEN min_price ELSE COALESCE((SELECT MIN(price) FROM products WHERE {owner_group}), min_price) END,
+            max_price = CASE WHEN {row}.price < max_price THEN max_price ELSE COALESCE((SELECT MAX(price) FROM products WHERE {owner_group}), max_price) END
+        WHERE {owner_group};
+
+        DELETE FROM owner_category_stats WHERE {owner_group} AND product_count <= 0;
+
+        UPDATE item_region_stats SET
+            product_count = product_count - 1,
+            total_stock = total_stock - {row}.stock_quantity,
+            price_sum_cents = price_sum_cents - {price_cents},
+            min_price = CASE WHEN {row}.price > min_price THEN min_price ELSE COALESCE((SELECT MIN(price) FROM products WHERE {region_group}), min_price) END
+        WHERE item = {row}.item AND lat_cell = {lat_cell} AND lon_cell = {lon_cell};
+
+        DELETE FROM item_region_stats WHERE item = {row}.item AND lat_cell = {lat_cell} AND lon_cell = {lon_cell} AND product_count <= 0;
+    """
+
+
+def _change_log_sql(table_name: str, columns: tuple[str, ...], operation: str, row: str) -> str:
+    if operation == "delete":
+        payload = "NULL"
+    else:
+        payload = "json_object(" + ", ".join(f"'{column}', {row}.{column}" for column in columns) + ")"
+
+    return f"""
+        INSERT INTO changes (table_name, row_id, operation, payload)
+        VALUES ('{table_name}', {row}.{columns[0]}, '{operation}', {payload});
+    """
+
+
+def summaries_rebuild():
+    with _storage.connect() as con:
+        cur = con.cursor()
+
+        cur.execute("DELETE FROM owner_category_stats")
+        cur.execute(f"""
+            INSERT INTO owner_category_stats (owner_id, category, product_count, total_stock, stock_value_cents, price_sum_cents, min_price, max_price)
+            SELECT owner_id, category, COUNT(*), SUM(stock_quantity), SUM({_cents('price')} * stock_quantity), SUM({_cents('price')}), MIN(price), MAX(price)
+            FROM products
+            GROUP BY owner_id, category
+        """)
+
+        cur.execute("DELETE FROM item_region_stats")
+        cur.execute(f"""
+            INSERT INTO item_region_stats (item, lat_cell, lon_cell, product_count, total_stock, price_sum_cents, min_price)
+            SELECT item, {_geo_cell('latitude', 90)}, {_geo_cell('longitude', 180)}, COUNT(*), SUM(stock_quantity), SUM({_cents('price')}), MIN(price)
+            FROM products
+            GROUP BY 1, 2, 3
+        """)
+
+        con.commit()
+
+
 def customers_insert_one(name: str, phone: str, email: str = "none@none.none"):
-    with sqlite3.connect("store.db") as con:
+    with _storage.connect() as con:
         cur = con.cursor()
 
         if name is None:
@@ -52,7 +254,7 @@ def customers_insert_one(name: str, phone: str, email: str = "none@none.none"):
 
 
 def customers_insert_many(customer_list: list[tuple[str, str, str]]):
-    with sqlite3.connect("store.db") as con:
+    with _storage.connect() as con:
         cur = con.cursor()
 
         for i, (name, phone, email) in enumerate(customer_list):
@@ -68,14 +270,14 @@ def customers_insert_many(customer_list: list[tuple[str, str, str]]):
 
 
 def customers_get_one(customer_id: int):
-    with sqlite3.connect("store.db") as con:
+    with _storage.connect() as con:
         cur = con.cursor()
         cur.execute("SELECT * FROM customers WHERE customer_id = ?", (customer_id,))
         return cur.fetchone()
 
 
 def customers_get_many(where_clause: str = None, params: tuple = None):
-    with sqlite3.connect("store.db") as con:
+    with _storage.connect_read() as con:
         cur = con.cursor()
         if where_clause:
             query = f"SELECT * FROM customers WHERE {where_clause}"
@@ -86,7 +288,7 @@ def customers_get_many(where_clause: str = None, params: tuple = None):
 
 
 def customers_update_one(customer_id: int, name: str = None, phone: str = None, email: str = None):
-    with sqlite3.connect("store.db") as con:
+    with _storage.connect() as con:
         cur = con.cursor()
 
         updates = []
@@ -113,7 +315,7 @@ def customers_update_one(customer_id: int, name: str = None, phone: str = None,
 
 
 def customers_update_many(where_clause: str, params: tuple, name: str = None, phone: str = None, email: str = None):
-    with sqlite3.connect("store.db") as con:
+    with _storage.connect() as con:
         cur = con.cursor()
 
         updates = []
@@ -139,14 +341,14 @@ def customers_update_many(where_clause: str, params: tuple, name: str = None, ph
 
 
 def customers_delete_one(customer_id: int):
-    with sqlite3.connect("store.db") as con:
+    with _storage.connect() as con:
         cur = con.cursor()
         cur.execute("DELETE FROM customers WHERE customer_id = ?", (customer_id,))
         con.commit()
 
 
 def customers_delete_many(where_clause: str, params: tuple):
-    with sqlite3.connect("store.db") as con:
+    with _storage.connect() as con:
         cur = con.cursor()
         query = f"DELETE FROM customers WHERE {where_clause}"
         cur.execute(query, params)
@@ -154,7 +356,7 @@ def customers_delete_many(where_clause: str, params: tuple):
 
 
 def products_insert_one(name: str, price: float, stock_quantity: int = 1, latitude: float = None, longitude: float = None, category: str = None, item: str = None, description: str = None, owner_id: int = None):
-    with sqlite3.connect("store.db") as con:
+    with _storage.connect() as con:
         cur = con.cursor()
 
         if name is None:
@@ -184,7 +386,7 @@ def products_insert_one(name: str, price: float, stock_quantity: int = 1, latitu
 
 
 def products_insert_many(product_list: list[tuple[str, float, int, float, float, str, str, str, int]]):
-    with sqlite3.connect("store.db") as con:
+    with _storage.connect() as con:
         cur = con.cursor()
 
         for i, (name, price, stock_quantity, latitude, longitude, category, item, description, owner_id) in enumerate(product_list):
@@ -215,14 +417,14 @@ def products_insert_many(product_list: list[tuple[str, float, int, float, float,
 
 
 def products_get_one(product_id: int):
-    with sqlite3.connect("store.db") as con:
+    with _storage.connect() as con:
         cur = con.cursor()
         cur.execute("SELECT * FROM products WHERE product_id = ?", (product_id,))
         return cur.fetchone()
 
 
 def products_get_many(where_clause: str = None, params: tuple = None):
-    with sqlite3.connect("store.db") as con:
+    with _storage.connect_read() as con:
         cur = con.cursor()
         if where_clause:
             query = f"SELECT * FROM products WHERE {where_clause}"
@@ -233,7 +435,7 @@ def products_get_many(where_clause: str = None, params: tuple = None):
 
 
 def products_get_listing():
-    with sqlite3.connect("store.db") as con:
+    with _storage.connect_read() as con:
         cur = con.cursor()
         cur.execute("""
             SELECT 
@@ -253,8 +455,35 @@ def products_get_listing():
         return cur.fetchall()
 
 
+def products_get_snapshot():
+    # the head is read first and on the same connection, so replaying from it afterwards can only repeat changes, never miss one
+    with _storage.connect_read() as con:
+        cur = con.cursor()
+        head = _changes_bounds(cur)[0]
+        cur.execute(f"""
+            SELECT p.product_id, {_SNAPSHOT_COLUMNS}
+            FROM products p
+        """)
+        return head, cur.fetchall()
+
+
+def product_changes_get(since: int):
+    # one row per product changed after `since`, with its current values (all NULL once deleted)
+    with _storage.connect_read() as con:
+        cur = con.cursor()
+        head, oldest = _changes_bounds(cur)
+        cur.execute(f"""
+            SELECT c.row_id, {_SNAPSHOT_COLUMNS}
+            FROM changes c
+            LEFT JOIN products p ON p.product_id = c.row_id
+            WHERE c.change_id > ? AND c.table_name = 'products'
+            GROUP BY c.row_id
+        """, (since,))
+        return head, oldest, cur.fetchall()
+
+
 def products_update_one(product_id: int, name: str = None, price: float = None, stock_quantity: int = None, latitude: float = None, longitude: float = None, category: str = None, item: str = None, description: str = None, owner_id: int = None):
-    with sqlite3.connect("store.db") as con:
+    with _storage.connect() as con:
         cur = con.cursor()
 
         updates = []
@@ -299,7 +528,7 @@ def products_update_one(product_id: int, name: str = None, price: float = None,
 
 
 def products_update_many(where_clause: str, params: tuple, name: str = None, price: float = None, stock_quantity: int = None, latitude: float = None, longitude: float = None, category: str = None, item: str = None, description: str = None, owner_id: int = None):
-    with sqlite3.connect("store.db") as con:
+    with _storage.connect() as con:
         cur = con.cursor()
 
         updates = []
@@ -343,15 +572,83 @@ def products_update_many(where_clause: str, params: tuple, name: str = None, pri
 
 
 def products_delete_one(product_id: int):
-    with sqlite3.connect("store.db") as con:
+    with _storage.connect() as con:
         cur = con.cursor()
         cur.execute("DELETE FROM products WHERE product_id = ?", (product_id,))
         con.commit()
 
 
 def products_delete_many(where_clause: str, params: tuple):
-    with sqlite3.connect("store.db") as con:
+    with _storage.connect() as con:
         cur = con.cursor()
         query = f"DELETE FROM products WHERE {where_clause}"
         cur.execute(query, params)
-        con.commit()
\ No newline at end of file
+        con.commit()
+
+
+def owner_stats_get(owner_id: int):
+    with _storage.connect_read() as con:
+        cur = con.cursor()
+        cur.execute("""
+            SELECT category, product_count, total_stock, stock_value_cents / 100.0, ROUND(price_sum_cents / 100.0 / product_count, 2), min_price, max_price
+            FROM owner_category_stats
+            WHERE owner_id = ?
+            ORDER BY category
+        """, (owner_id,))
+        return cur.fetchall()
+
+
+def item_price_stats_get(item: str, latitude: float = None, longitude: float = None):
+    if (latitude is None) != (longitude is None):
+        print("latitude and longitude must be given together!")
+        return
+
+    with _storage.connect_read() as con:
+        cur = con.cursor()
+        query = """
+            SELECT lat_cell, lon_cell, product_count, total_stock, ROUND(price_sum_cents / 100.0 / product_count, 2), min_price
+            FROM item_region_stats
+            WHERE item = ?
+        """
+        if latitude is not None and longitude is not None:
+            cur.execute(query + " AND lat_cell = ? AND lon_cell = ?", (item, *geo_cell(latitude, longitude)))
+        else:
+            cur.execute(query + " ORDER BY min_price", (item,))
+        return cur.fetchall()
+
+
+def _changes_bounds(cur) -> tuple[int, int]:
+    # the head comes from sqlite_sequence so it survives pruning the whole log;
+    # everything below `oldest` has been pruned and can no longer be replayed
+    cur.execute("""
+        SELECT
+            COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'changes'), 0),
+            (SELECT MIN(change_id) FROM changes)
+    """)
+    head, oldest = cur.fetchone()
+    return head, oldest if oldest is not None else head + 1
+
+
+def changes_get(since: int = 0, limit: int = 1000):
+    # the change feed reads the primary, a replica would hide its newest entries and make fresh cursors look invalid
+    with _storage.connect() as con:
+        cur = con.cursor()
+        cur.execute("""
+            SELECT change_id, table_name, row_id, operation, payload, changed_at
+            FROM changes
+            WHERE change_id > ?
+            ORDER BY change_id
+            LIMIT ?
+        """, (since, limit))
+        return cur.fetchall()
+
+
+def changes_get_bounds():
+    with _storage.connect() as con:
+        return _changes_bounds(con.cursor())
+
+
+def changes_head() -> int:
+    # read where the listings are read, so it is the position they are current up to
+    with _storage.connect_read() as con:
+        return _changes_bounds(con.cursor())[0]
@@ -1,17 +1,41 @@
-from fastapi import FastAPI, HTTPException
+import asyncio
+import json
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Optional
 
 from DB import *
+from catalog import CatalogSnapshot
+from changefeed import ChangeBroadcaster
+from responses import GZIP_COMPRESS_LEVEL, LISTING_FIELDS, FastJSONResponse, negotiate
 from tarjimani.lang2lang import create_models, translate
 
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # load the whole catalog before serving, so no /best-offers request waits on the cold load
+    await asyncio.to_thread(catalog.refresh)
+    await change_broadcaster.start()
+    yield
+    await change_broadcaster.stop()
+
+
 create_database()
-app = FastAPI()
+app = FastAPI(default_response_class=FastJSONResponse, lifespan=lifespan)
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_credentials=True, allow_methods=["*"], allow_headers=["*"])
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=GZIP_COMPRESS_LEVEL)
 translation_models = {}
+catalog = CatalogSnapshot()
+CHANGE_POLL_SECONDS = 1.0
+CHANGE_KEEPALIVE_SECONDS = 15.0
+MAX_CHANGES_LIMIT = 5000
+change_broadcaster = ChangeBroadcaster(CHANGE_POLL_SECONDS)
 
 
 class CustomerCreate(BaseModel):
@@ -70,9 +94,9 @@ def create_customer(customer: CustomerCreate):
 
 
 @app.get("/customers")
-def get_customers():
+def get_customers(request: Request):
     customers = customers_get_many()
-    return {"customers": customers}
+    return negotiate(request, {"customers": customers})
 
 
 @app.get("/customers/{customer_id}")
@@ -83,6 +107,27 @@ def get_customer(customer_id: int):
     return {"customer": customer}
 
 
+@app.get("/customers/{customer_id}/stats")
+def get_seller_stats(customer_id: int):
+    categories = []
+    totals = {"product_count": 0, "total_stock": 0, "stock_value": 0.0}
+    for category, product_count, total_stock, stock_value, avg_price, min_price, max_price in owner_stats_get(customer_id):
+        categories.append({
+            "category": category,
+            "product_count": product_count,
+            "total_stock": total_stock,
+            "stock_value": stock_value,
+            "avg_price": avg_price,
+            "min_price": min_price,
+            "max_price": max_price
+        })
+        totals["product_count"] += product_count
+        totals["total_stock"] += total_stock
+        totals["stock_value"] += stock_value
+    totals["stock_value"] = round(totals["stock_value"], 2)
+    return {"totals": totals, "categories": categories}
+
+
 @app.put("/customers/{customer_id}")
 def update_customer(customer_id: int, customer: CustomerUpdate):
     try:
@@ -121,12 +166,13 @@ def create_product(product: ProductCreate):
 
 
 @app.get("/products")
-def get_products(category: Optional[str] = None):
+def get_products(request: Request, category: Optional[str] = None):
+    head_change_id = changes_head()
     if category:
         products = products_get_many("category = ?", (category,))
     else:
         products = products_get_many()
-    return {"products": products}
+    return negotiate(request, {"products": products, "head_change_id": head_change_id})
 
 
 @app.get("/products/{product_id}")
@@ -138,23 +184,38 @@ def get_product(product_id: int):
 
 
 @app.get("/product-listings")
-def get_products_for_listing():
+def get_products_for_listing(request: Request):
+    head_change_id = changes_head()
     products = products_get_listing()
-    result = []
-    for product in products:
-        result.append({
-            "name": product[0],
-            "seller": product[1],
-            "seller_phone": product[2],
-            "price": product[3],
-            "stock_quantity": product[4],
-            "latitude": product[5],
-            "longitude": product[6],
-            "category": product[7],
-            "item": product[8],
-            "description": product[9]
+    result = [dict(zip(LISTING_FIELDS, product)) for product in products]
+    return negotiate(request, {"products": result, "head_change_id": head_change_id})
+
+
+@app.get("/items/{item}/price-stats")
+def get_item_price_stats(item: str, latitude: Optional[float] = None, longitude: Optional[float] = None):
+    if (latitude is None) != (longitude is None):
+        raise HTTPException(status_code=400, detail="latitude and longitude must be given together")
+    regions = []
+    for lat_cell, lon_cell, product_count, total_stock, avg_price, min_price in item_price_stats_get(item, latitude, longitude):
+        regions.append({
+            "latitude": lat_cell * GEO_CELL_DEGREES - 90,
+            "longitude": lon_cell * GEO_CELL_DEGREES - 180,
+            "cell_degrees": GEO_CELL_DEGREES,
+            "product_count": product_count,
+            "total_stock": total_stock,
+            "avg_price": avg_price,
+            "min_price": min_price
         })
-    return {"products": result}
+    return {"item": item, "regions": regions}
+
+
+@app.get("/best-offers")
+def get_best_offers(request: Request, latitude: float, longitude: float, radius_km: float = 50.0, category: Optional[str] = None, item: Optional[str] = None, limit: int = 20, distance_weight: float = 0.0, freshness_weight: float = 0.0):
+    if radius_km <= 0 or limit <= 0:
+        raise HTTPException(status_code=400, detail="radius_km and limit must be positive")
+    catalog.refresh()
+    offers = catalog.best_offers(latitude, longitude, radius_km, category, item, limit, distance_weight, freshness_weight)
+    return negotiate(request, {"products": offers})
 
 
 @app.put("/products/{product_id}")
@@ -185,6 +246,82 @@ def delete_product(product_id: int):
         raise HTTPException(status_code=400, detail=str(e))
 
 
+def format_changes(changes):
+    return [
+        {
+            "change_id": change_id,
+            "table": table_name,
+            "row_id": row_id,
+            "operation": operation,
+            "row": json.loads(payload) if payload is not None else None,
+            "changed_at": changed_at
+        }
+        for change_id, table_name, row_id, operation, payload, changed_at in changes
+    ]
+
+
+def check_changes_since(since: int, head_change_id: int, oldest_change_id: int):
+    if since < oldest_change_id - 1 or since > head_change_id:
+        raise HTTPException(status_code=410, detail=f"Changes after {since} are no longer available, refetch and resume from head_change_id {head_change_id}")
+
+
+@app.get("/changes")
+def get_changes(request: Request, since: int = 0, limit: int = 1000):
+    if limit <= 0:
+        raise HTTPException(status_code=400, detail="limit must be positive")
+    head_change_id, oldest_change_id = changes_get_bounds()
+    check_changes_since(since, head_change_id, oldest_change_id)
+
+    changes = format_changes(changes_get(since, min(limit, MAX_CHANGES_LIMIT)))
+    last_change_id = changes[-1]["change_id"] if changes else since
+    return negotiate(request, {"changes": changes, "last_change_id": last_change_id, "head_change_id": head_change_id})
+
+
+@app.get("/changes/stream")
+async def stream_changes(request: Request, since: Optional[int] = None):
+    last_event_id = request.headers.get("last-event-id")
+    if last_event_id and last_event_id.isdigit():
+        since = int(last_event_id)
+
+    head_change_id, oldest_change_id = await asyncio.to_thread(changes_get_bounds)
+    if since is None:
+        since = head_change_id
+    check_changes_since(since, head_change_id, oldest_change_id)
+
+    def format_event(change) -> str:
+        change = format_changes([change])[0]
+        return f"id: {change['change_id']}\nevent: {change['table']}\ndata: {json.dumps(change)}\n\n"
+
+    async def events():
+        # subscribe before catching up, so nothing committed in between is lost; duplicates are skipped by id
+        queue = change_broadcaster.subscribe()
+        try:
+            last_change_id = since
+            while True:
+                backlog = await asyncio.to_thread(changes_get, last_change_id, MAX_CHANGES_LIMIT)
+                for change in backlog:
+                    last_change_id = change[0]
+                    yield format_event(change)
+                if len(backlog) < MAX_CHANGES_LIMIT:
+                    break
+
+            while True:
+                try:
+                    change = await asyncio.wait_for(queue.get(), CHANGE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if change is None:
+                    return
+                if change[0] > last_change_id:
+                    last_change_id = change[0]
+                    yield format_event(change)
+        finally:
+            change_broadcaster.unsubscribe(queue)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
 @app.post("/translate")
 def translate_text(request: TranslateRequest):
     cache_key = f"{request.lang_from}_{request.lang_to}"
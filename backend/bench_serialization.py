@@ -0,0 +1,80 @@
+import gzip
+import json
+import random
+import sys
+import timeit
+
+from fastapi.encoders import jsonable_encoder
+
+from responses import GZIP_COMPRESS_LEVEL, LISTING_FIELDS, dumps_json, msgpack
+
+
+def make_product_rows(count: int):
+    rng = random.Random(0)
+    return [
+        (i, f"product {i}", round(rng.uniform(1, 50), 2), rng.randint(1, 500), rng.uniform(41, 43.5), rng.uniform(40, 46.5), rng.choice(["vegetables", "fruit", "dairy"]), rng.choice(["tomato", "apple", "cheese"]), "organic, from the farm", rng.randint(1, 100), "2025-10-01 12:00:00")
+        for i in range(count)
+    ]
+
+
+def make_listing_rows(count: int):
+    return [(row[1], f"seller {row[9]}", "+995555000000", row[2], row[3], row[4], row[5], row[6], row[7], row[8]) for row in make_product_rows(count)]
+
+
+def encode_default(content) -> bytes:
+    # what FastAPI does for a returned dict: jsonable_encoder, then JSONResponse.render
+    return json.dumps(jsonable_encoder(content), ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def listing_before(rows):
+    result = []
+    for product in rows:
+        result.append({
+            "name": product[0],
+            "seller": product[1],
+            "seller_phone": product[2],
+            "price": product[3],
+            "stock_quantity": product[4],
+            "latitude": product[5],
+            "longitude": product[6],
+            "category": product[7],
+            "item": product[8],
+            "description": product[9]
+        })
+    return encode_default({"products": result})
+
+
+def listing_after(rows):
+    return dumps_json({"products": [dict(zip(LISTING_FIELDS, product)) for product in rows]})
+
+
+def report(label: str, func, repeat: int):
+    seconds = min(timeit.repeat(func, number=1, repeat=repeat))
+    print(f"{label:<40} {seconds * 1000:8.2f} ms")
+    return seconds
+
+
+def main(count: int = 10_000, repeat: int = 5):
+    products = {"products": make_product_rows(count)}
+    listing = make_listing_rows(count)
+
+    print(f"serialization of {count} rows (best of {repeat})")
+    before = report("/products default encoder", lambda: encode_default(products), repeat)
+    after = report("/products fast JSON", lambda: dumps_json(products), repeat)
+    print(f"{'speedup':<40} {before / after:8.1f} x")
+    if msgpack is not None:
+        report("/products msgpack", lambda: msgpack.packb(products, use_bin_type=True), repeat)
+
+    before = report("/product-listings default encoder", lambda: listing_before(listing), repeat)
+    after = report("/product-listings fast JSON", lambda: listing_after(listing), repeat)
+    print(f"{'speedup':<40} {before / after:8.1f} x")
+
+    body = dumps_json(products)
+    print(f"/products body {len(body)} bytes")
+    for level in sorted({1, GZIP_COMPRESS_LEVEL, 6, 9}):
+        compressed = len(gzip.compress(body, compresslevel=level))
+        report(f"gzip level {level}, {compressed} bytes", lambda: gzip.compress(body, compresslevel=level), repeat)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000)
@@ -0,0 +1,192 @@
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+
+from DB import product_changes_get, products_get_snapshot
+
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE_LATITUDE = 111.2
+
+COLUMNS = {
+    "product_id": np.int64,
+    "price": np.float64,
+    "stock_quantity": np.int64,
+    "latitude": np.float64,
+    "longitude": np.float64,
+    "created_at": np.float64,
+    "category": np.int32,
+    "item": np.int32,
+}
+
+
+class CatalogSnapshot:
+    def __init__(self, capacity: int = 1024):
+        self.size = 0
+        self.revision: Optional[int] = None
+        self.columns = {name: np.empty(capacity, dtype=dtype) for name, dtype in COLUMNS.items()}
+        self.categories: list[str] = []
+        self.items: list[str] = []
+        self._category_codes: dict[str, int] = {}
+        self._item_codes: dict[str, int] = {}
+        self._positions: dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self.size
+
+    def column(self, name: str) -> np.ndarray:
+        return self.columns[name][:self.size]
+
+    def refresh(self):
+        with self._lock:
+            # replay the log from the last revision, or reload everything if that part of the log was pruned
+            if self.revision is not None:
+                head, oldest, changes = product_changes_get(self.revision)
+                if self.revision >= oldest - 1:
+                    for product_id, *values in changes:
+                        if values[0] is None:
+                            self._remove(product_id)
+                        else:
+                            self._upsert(product_id, values)
+                    self.revision = head
+                    return
+            head, rows = products_get_snapshot()
+            self._load(rows)
+            self.revision = head
+
+    def _code(self, codes: dict[str, int], names: list[str], name: str) -> int:
+        code = codes.get(name)
+        if code is None:
+            code = codes[name] = len(names)
+            names.append(name)
+        return code
+
+    def _grow(self, needed: int):
+        capacity = len(self.columns["product_id"])
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        for name, array in self.columns.items():
+            grown = np.empty(capacity, dtype=array.dtype)
+            grown[:self.size] = array[:self.size]
+            self.columns[name] = grown
+
+    def _load(self, rows: list[tuple]):
+        count = len(rows)
+        self._grow(count)
+
+        for index, name in enumerate(("product_id", "price", "stock_quantity", "latitude", "longitude", "created_at")):
+            self.columns[name][:count] = np.fromiter((row[index] for row in rows), dtype=COLUMNS[name], count=count)
+        self.columns["category"][:count] = [self._code(self._category_codes, self.categories, row[6]) for row in rows]
+        self.columns["item"][:count] = [self._code(self._item_codes, self.items, row[7]) for row in rows]
+
+        self._positions = {row[0]: position for position, row in enumerate(rows)}
+        self.size = count
+
+    def _upsert(self, product_id: int, values: list):
+        price, stock_quantity, latitude, longitude, created_at, category, item = values
+
+        position = self._positions.get(product_id)
+        if position is None:
+            self._grow(self.size + 1)
+            position = self._positions[product_id] = self.size
+            self.size += 1
+
+        self.columns["product_id"][position] = product_id
+        self.columns["price"][position] = price
+        self.columns["stock_quantity"][position] = stock_quantity
+        self.columns["latitude"][position] = latitude
+        self.columns["longitude"][position] = longitude
+        self.columns["created_at"][position] = created_at
+        self.columns["category"][position] = self._code(self._category_codes, self.categories, category)
+        self.columns["item"][position] = self._code(self._item_codes, self.items, item)
+
+    def _remove(self, product_id: int):
+        position = self._positions.pop(product_id, None)
+        if position is None:
+            return
+
+        # keep the arrays dense by moving the last row into the hole
+        last = self.size - 1
+        if position != last:
+            for array in self.columns.values():
+                array[position] = array[last]
+            self._positions[int(self.columns["product_id"][position])] = position
+        self.size = last
+
+    def mask(self, category: str = None, item: str = None, min_stock: int = 1, max_price: float = None) -> np.ndarray:
+        mask = self.column("stock_quantity") >= min_stock
+        if category is not None:
+            mask &= self.column("category") == self._category_codes.get(category, -1)
+        if item is not None:
+            mask &= self.column("item") == self._item_codes.get(item, -1)
+        if max_price is not None:
+            mask &= self.column("price") <= max_price
+        return mask
+
+    def distances_km(self, latitude: float, longitude: float, positions: np.ndarray = None) -> np.ndarray:
+        latitudes = self.column("latitude")
+        longitudes = self.column("longitude")
+        if positions is not None:
+            latitudes = latitudes[positions]
+            longitudes = longitudes[positions]
+
+        lat1 = np.radians(latitude)
+        lat2 = np.radians(latitudes)
+        half_dlat = (lat2 - lat1) / 2
+        half_dlon = np.radians(longitudes - longitude) / 2
+        a = np.sin(half_dlat) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(half_dlon) ** 2
+        return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+    def best_offers(self, latitude: float, longitude: float, radius_km: float = 50.0, category: str = None, item: str = None, limit: int = 20, distance_weight: float = 0.0, freshness_weight: float = 0.0) -> list[dict]:
+        with self._lock:
+            mask = self.mask(category=category, item=item)
+            # cheap latitude band before the trigonometry
+            mask &= np.abs(self.column("latitude") - latitude) <= radius_km / KM_PER_DEGREE_LATITUDE
+            positions = np.flatnonzero(mask)
+
+            distances = self.distances_km(latitude, longitude, positions)
+            in_radius = distances <= radius_km
+            positions = positions[in_radius]
+            distances = distances[in_radius]
+
+            # distance_weight is a price per km, freshness_weight a price per day of listing age
+            scores = self.column("price")[positions] + distance_weight * distances
+            if freshness_weight:
+                scores += freshness_weight * (time.time() - self.column("created_at")[positions]) / 86400
+
+            if len(positions) > limit:
+                top = np.argpartition(scores, limit)[:limit]
+            else:
+                top = np.arange(len(positions))
+            top = top[np.argsort(scores[top], kind="stable")]
+
+            selected = positions[top]
+            return [
+                {
+                    "product_id": product_id,
+                    "price": price,
+                    "stock_quantity": stock_quantity,
+                    "latitude": lat,
+                    "longitude": lon,
+                    "category": self.categories[category_code],
+                    "item": self.items[item_code],
+                    "distance_km": distance,
+                    "score": score
+                }
+                for product_id, price, stock_quantity, lat, lon, category_code, item_code, distance, score in zip(
+                    self.column("product_id")[selected].tolist(),
+                    self.column("price")[selected].tolist(),
+                    self.column("stock_quantity")[selected].tolist(),
+                    self.column("latitude")[selected].tolist(),
+                    self.column("longitude")[selected].tolist(),
+                    self.column("category")[selected].tolist(),
+                    self.column("item")[selected].tolist(),
+                    distances[top].tolist(),
+                    scores[top].tolist()
+                )
+            ]
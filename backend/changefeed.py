@@ -0,0 +1,75 @@
+import asyncio
+from contextlib import suppress
+from typing import Optional
+
+from DB import changes_get, changes_get_bounds
+
+
+class ChangeBroadcaster:
+    def __init__(self, poll_seconds: float = 1.0, batch_size: int = 1000, queue_size: int = 10_000):
+        self.poll_seconds = poll_seconds
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.last_change_id = 0
+        self._subscribers: set[asyncio.Queue] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self.last_change_id = (await asyncio.to_thread(changes_get_bounds))[0]
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        # open streams are ended so the server can shut down
+        for queue in list(self._subscribers):
+            self._drop(queue)
+        if self._task is None:
+            return
+        self._task.cancel()
+        with suppress(asyncio.CancelledError):
+            await self._task
+        self._task = None
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(self.queue_size)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    async def poll(self):
+        # one query per process and tick, however many streams are open
+        if not self._subscribers:
+            head = (await asyncio.to_thread(changes_get_bounds))[0]
+            # a stream that subscribed meanwhile may not have caught up to this head yet
+            if not self._subscribers:
+                self.last_change_id = head
+            return
+
+        while True:
+            changes = await asyncio.to_thread(changes_get, self.last_change_id, self.batch_size)
+            for change in changes:
+                for queue in list(self._subscribers):
+                    try:
+                        queue.put_nowait(change)
+                    except asyncio.QueueFull:
+                        self._drop(queue)
+            if changes:
+                self.last_change_id = changes[-1][0]
+            if len(changes) < self.batch_size:
+                return
+
+    def _drop(self, queue: asyncio.Queue):
+        # a subscriber this far behind is closed rather than skipped ahead, it resumes from Last-Event-ID
+        self._subscribers.discard(queue)
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(None)
+
+    async def _run(self):
+        while True:
+            try:
+                await self.poll()
+            except Exception as e:
+                print(f"Change feed poll failed: {e}")
+            await asyncio.sleep(self.poll_seconds)
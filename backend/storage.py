@@ -0,0 +1,155 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+from urllib.parse import parse_qs
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class SQLiteStorage:
+    def __init__(self, path: str = "store.db"):
+        self.path = path
+
+    def connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path)
+
+    def connect_read(self) -> sqlite3.Connection:
+        return self.connect()
+
+
+class ReplicaSQLiteStorage(SQLiteStorage):
+    def __init__(self, path: str = "store.db", replica_path: str = None, sync_seconds: float = 5.0):
+        super().__init__(path)
+        if replica_path is None:
+            base, ext = os.path.splitext(path)
+            replica_path = f"{base}.replica{ext}"
+        self.replica_path = replica_path
+        self.lock_path = f"{replica_path}.lock"
+        self.sync_seconds = sync_seconds
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._thread_pid: Optional[int] = None
+        self._thread_lock = threading.Lock()
+
+    def primary_version(self) -> int:
+        # the file change counter in the database header, bumped by every committed write (rollback journal mode)
+        with open(self.path, "rb") as f:
+            f.seek(24)
+            return int.from_bytes(f.read(4), "big")
+
+    def replica_version(self) -> Optional[int]:
+        try:
+            con = sqlite3.connect(f"file:{os.path.abspath(self.replica_path)}?mode=ro", uri=True)
+            try:
+                return con.execute("SELECT change_counter FROM replica_sync").fetchone()[0]
+            finally:
+                con.close()
+        except sqlite3.Error:
+            return None
+
+    def sync(self):
+        # the backup API gives a consistent copy even while the primary is being written;
+        # os.replace swaps it in atomically so open readers keep the snapshot they started with
+        tmp_path = f"{self.replica_path}.{os.getpid()}.tmp"
+        source = sqlite3.connect(self.path, isolation_level=None)
+        target = sqlite3.connect(tmp_path)
+        try:
+            # the header is read inside the same read transaction as the copy, so the two match
+            source.execute("BEGIN")
+            source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+            version = self.primary_version()
+            source.backup(target)
+            source.execute("COMMIT")
+            with target:
+                target.execute("CREATE TABLE replica_sync (change_counter INTEGER NOT NULL)")
+                target.execute("INSERT INTO replica_sync VALUES (?)", (version,))
+        finally:
+            target.close()
+            source.close()
+        os.replace(tmp_path, self.replica_path)
+
+    def is_stale(self) -> bool:
+        try:
+            synced_at = os.path.getmtime(self.replica_path)
+        except FileNotFoundError:
+            return True
+        # only the replica's own age is measured with the clock; whether the primary changed is decided
+        # by its header counter, which coarse mtimes and clock adjustments cannot fool
+        return time.time() - synced_at > self.sync_seconds and self.replica_version() != self.primary_version()
+
+    def sync_if_stale(self) -> bool:
+        if not self.is_stale():
+            return False
+
+        with open(self.lock_path, "a") as lock_file:
+            if fcntl is not None:
+                # every worker on the host runs this loop, only the one holding the lock copies the database
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return False
+            if not self.is_stale():
+                return False
+            self.sync()
+            return True
+
+    def _sync_loop(self):
+        while True:
+            try:
+                self.sync_if_stale()
+            except (OSError, sqlite3.Error) as e:
+                print(f"Replica sync of {self.path} failed: {e}")
+            if self._stop.wait(self.sync_seconds):
+                return
+
+    def start(self):
+        # started lazily and per process, a thread started before a fork does not survive in the child
+        with self._thread_lock:
+            if self._thread is not None and self._thread_pid == os.getpid() and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._sync_loop, daemon=True)
+            self._thread_pid = os.getpid()
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None and self._thread_pid == os.getpid():
+            self._thread.join()
+        self._thread = None
+
+    def connect_read(self) -> sqlite3.Connection:
+        self.start()
+        if not os.path.exists(self.replica_path):
+            return self.connect()
+        return sqlite3.connect(f"file:{os.path.abspath(self.replica_path)}?mode=ro&immutable=1", uri=True)
+
+
+def storage_from_url(url: str) -> SQLiteStorage:
+    scheme, separator, rest = url.partition("://")
+    if not separator:
+        return SQLiteStorage(url)
+
+    path, _, query = rest.partition("?")
+    # sqlite:///store.db is relative, sqlite:////var/lib/store.db is absolute
+    path = path[1:] if path.startswith("/") else path
+    options = {key: values[-1] for key, values in parse_qs(query).items()}
+
+    if scheme == "sqlite":
+        return SQLiteStorage(path)
+    if scheme == "sqlite+replica":
+        return ReplicaSQLiteStorage(
+            path,
+            replica_path=options.get("replica"),
+            sync_seconds=float(options.get("sync_seconds", 5.0))
+        )
+    raise ValueError(f"Unsupported storage URL scheme: {scheme}")
+
+
+def storage_from_env() -> SQLiteStorage:
+    return storage_from_url(os.environ.get("STORE_DB_URL", "store.db"))
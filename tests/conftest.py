@@ -0,0 +1,43 @@
+import os
+import sys
+import types
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+import DB
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    DB.create_database()
+    DB.customers_insert_many([("farmer one", "+995555000001", "one@farm.ge"), ("farmer two", "+995555000002", "two@farm.ge")])
+    return tmp_path
+
+
+@pytest.fixture
+def app(db, monkeypatch):
+    # the translation models pull in torch and transformers, the store endpoints do not need them
+    lang2lang = types.ModuleType("tarjimani.lang2lang")
+    lang2lang.create_models = lang2lang.translate = None
+    monkeypatch.setitem(sys.modules, "tarjimani", types.ModuleType("tarjimani"))
+    monkeypatch.setitem(sys.modules, "tarjimani.lang2lang", lang2lang)
+
+    import backend
+    from catalog import CatalogSnapshot
+    from changefeed import ChangeBroadcaster
+
+    # each test gets a fresh database, so module level state must not carry over
+    monkeypatch.setattr(backend, "catalog", CatalogSnapshot())
+    monkeypatch.setattr(backend, "change_broadcaster", ChangeBroadcaster(poll_seconds=0.01))
+    return backend
+
+
+@pytest.fixture
+def client(app):
+    from fastapi.testclient import TestClient
+
+    with TestClient(app.app) as test_client:
+        yield test_client
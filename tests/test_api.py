@@ -0,0 +1,77 @@
+def create_product(client, **fields):
+    product = {"name": "tomato", "price": 2.5, "stock_quantity": 4, "latitude": 41.93, "longitude": 44.8, "category": "vegetables", "item": "tomato", "owner_id": 1}
+    product.update(fields)
+    response = client.post("/products", json=product)
+    assert response.status_code == 200
+    return product
+
+
+def test_seller_stats(client):
+    create_product(client, price=2.5, stock_quantity=4)
+    create_product(client, price=3.0, stock_quantity=2)
+    create_product(client, category="fruit", item="apple", price=1.2, stock_quantity=10)
+    create_product(client, owner_id=2, price=99.0)
+
+    response = client.get("/customers/1/stats")
+    assert response.status_code == 200
+    assert response.json() == {
+        "totals": {"product_count": 3, "total_stock": 16, "stock_value": 28.0},
+        "categories": [
+            {"category": "fruit", "product_count": 1, "total_stock": 10, "stock_value": 12.0, "avg_price": 1.2, "min_price": 1.2, "max_price": 1.2},
+            {"category": "vegetables", "product_count": 2, "total_stock": 6, "stock_value": 16.0, "avg_price": 2.75, "min_price": 2.5, "max_price": 3.0},
+        ],
+    }
+
+
+def test_item_price_stats_by_region(client):
+    create_product(client, price=2.5)
+    create_product(client, price=2.0, latitude=41.6, longitude=41.6)
+
+    regions = client.get("/items/tomato/price-stats").json()["regions"]
+    assert [region["min_price"] for region in regions] == [2.0, 2.5]
+
+    regions = client.get("/items/tomato/price-stats", params={"latitude": 41.9, "longitude": 44.7}).json()["regions"]
+    assert [(region["latitude"], region["longitude"], region["min_price"]) for region in regions] == [(41.5, 44.5, 2.5)]
+
+
+def test_item_price_stats_requires_both_coordinates(client):
+    create_product(client)
+    assert client.get("/items/tomato/price-stats", params={"latitude": 41.9}).status_code == 400
+    assert client.get("/items/tomato/price-stats", params={"longitude": 44.7}).status_code == 400
+
+
+def test_catalog_is_loaded_at_startup(client, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    import backend
+    import DB
+    from catalog import CatalogSnapshot
+
+    DB.products_insert_many([("tomato", price, 4, latitude, 44.8, "vegetables", "tomato", None, 1) for price, latitude in ((1.5, 41.93), (0.9, 41.95), (0.5, 45.0))])
+    monkeypatch.setattr(backend, "catalog", CatalogSnapshot())
+
+    with TestClient(backend.app) as restarted:
+        assert len(backend.catalog) == 3
+        offers = restarted.get("/best-offers", params={"latitude": 41.93, "longitude": 44.8, "radius_km": 50}).json()["products"]
+    assert [offer["price"] for offer in offers] == [0.9, 1.5]
+
+
+def test_changes_beyond_retention_answer_410(client, monkeypatch):
+    import DB
+
+    monkeypatch.setattr(DB, "CHANGES_RETAINED", 3)
+    DB.create_database()
+    for price in (1.0, 2.0, 3.0, 4.0, 5.0):
+        create_product(client, price=price)
+
+    head = client.get("/products").json()["head_change_id"]
+    assert head == 7
+    assert client.get("/changes", params={"since": 0}).status_code == 410
+    assert client.get("/changes/stream", params={"since": 0}).status_code == 410
+
+    changes = client.get("/changes", params={"since": head - 3}).json()
+    assert [change["change_id"] for change in changes["changes"]] == [5, 6, 7]
+
+    # the catalog snapshot fell behind the retained log and reloads in full
+    offers = client.get("/best-offers", params={"latitude": 41.93, "longitude": 44.8}).json()["products"]
+    assert [offer["price"] for offer in offers] == [1.0, 2.0, 3.0, 4.0, 5.0]
@@ -0,0 +1,99 @@
+import math
+import random
+
+import DB
+from catalog import CatalogSnapshot
+
+
+def random_product(rng: random.Random):
+    return ("p", round(rng.uniform(1, 10), 2), rng.randint(0, 5), rng.uniform(41, 43), rng.uniform(43, 45), rng.choice(["fruit", "dairy"]), rng.choice(["apple", "milk", "pear"]), None, rng.randint(1, 2))
+
+
+def assert_snapshot_matches(snapshot: CatalogSnapshot):
+    snapshot.refresh()
+    rows = DB.products_get_many()
+    expected = {row[0]: (row[2], row[3], row[4], row[5], row[6], row[7]) for row in rows}
+    actual = {
+        product_id: (price, stock_quantity, latitude, longitude, snapshot.categories[category], snapshot.items[item])
+        for product_id, price, stock_quantity, latitude, longitude, category, item in zip(
+            snapshot.column("product_id").tolist(),
+            snapshot.column("price").tolist(),
+            snapshot.column("stock_quantity").tolist(),
+            snapshot.column("latitude").tolist(),
+            snapshot.column("longitude").tolist(),
+            snapshot.column("category").tolist(),
+            snapshot.column("item").tolist()
+        )
+    }
+    assert len(snapshot) == len(rows)
+    assert actual == expected
+
+
+def test_refresh_applies_update_append_and_swap_remove(db):
+    DB.products_insert_many([("apple", 2.0 + i, 3, 42.0, 44.0, "fruit", "apple", None, 1) for i in range(4)])
+    snapshot = CatalogSnapshot(capacity=2)
+    assert_snapshot_matches(snapshot)
+
+    DB.products_update_one(2, price=9.5, item="pear")
+    assert_snapshot_matches(snapshot)
+
+    DB.products_insert_one("milk", 1.1, 2, 41.7, 44.8, "dairy", "milk", None, 2)
+    assert_snapshot_matches(snapshot)
+
+    # removing the first row moves the last one into its slot
+    DB.products_delete_one(1)
+    assert_snapshot_matches(snapshot)
+    DB.products_delete_one(5)
+    assert_snapshot_matches(snapshot)
+
+
+def test_refresh_matches_products_after_random_mutations(db):
+    rng = random.Random(11)
+    DB.products_insert_many([random_product(rng) for _ in range(200)])
+    snapshot = CatalogSnapshot(capacity=16)
+    assert_snapshot_matches(snapshot)
+
+    for step in range(400):
+        product_ids = [row[0] for row in DB.products_get_many()]
+        roll = rng.random()
+        if roll < 0.3:
+            DB.products_insert_one(*random_product(rng))
+        elif roll < 0.6:
+            DB.products_delete_one(rng.choice(product_ids))
+        else:
+            DB.products_update_one(rng.choice(product_ids), price=round(rng.uniform(1, 10), 2), stock_quantity=rng.randint(0, 5))
+        if step % 25 == 0:
+            assert_snapshot_matches(snapshot)
+    assert_snapshot_matches(snapshot)
+
+
+def test_refresh_reloads_when_its_revision_was_pruned(db, monkeypatch):
+    monkeypatch.setattr(DB, "CHANGES_RETAINED", 1)
+    DB.create_database()
+    DB.products_insert_many([("pear", 3.0, 1, 42.0, 44.0, "fruit", "pear", None, 1)] * 2)
+    snapshot = CatalogSnapshot()
+    snapshot.refresh()
+
+    DB.products_delete_one(1)
+    DB.products_insert_one("pear", 4.0, 1, 42.0, 44.0, "fruit", "pear", None, 1)
+    assert DB.changes_get_bounds()[1] - 1 > snapshot.revision
+    assert_snapshot_matches(snapshot)
+
+
+def test_best_offers_matches_brute_force(db):
+    rng = random.Random(5)
+    DB.products_insert_many([random_product(rng) for _ in range(300)])
+    snapshot = CatalogSnapshot()
+    snapshot.refresh()
+
+    def haversine_km(lat1, lon1, lat2, lon2):
+        lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+        a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+        return 2 * 6371.0088 * math.asin(math.sqrt(a))
+
+    expected = sorted(
+        (row[2], row[0]) for row in DB.products_get_many("item = ? AND stock_quantity >= 1", ("apple",))
+        if haversine_km(42.0, 44.0, row[4], row[5]) <= 50
+    )[:5]
+    offers = snapshot.best_offers(42.0, 44.0, radius_km=50, item="apple", limit=5)
+    assert [(offer["price"], offer["product_id"]) for offer in offers] == expected
@@ -0,0 +1,121 @@
+import asyncio
+
+import pytest
+from starlette.requests import Request
+
+import changefeed
+import DB
+from changefeed import ChangeBroadcaster
+
+
+def create_product(client, price: float):
+    response = client.post("/products", json={"name": "kiwi", "price": price, "latitude": 41.6, "longitude": 41.6, "category": "fruit", "item": "kiwi", "owner_id": 1})
+    assert response.status_code == 200
+
+
+def test_changes_endpoint_pages_and_reports_head(client, app, monkeypatch):
+    for price in (1.0, 2.0, 3.0):
+        create_product(client, price)
+
+    body = client.get("/changes", params={"since": 0}).json()
+    assert [change["operation"] for change in body["changes"]] == ["insert"] * 5
+    assert body["changes"][2]["row"]["price"] == 1.0
+    assert (body["last_change_id"], body["head_change_id"]) == (5, 5)
+
+    body = client.get("/changes", params={"since": 5}).json()
+    assert (body["changes"], body["last_change_id"], body["head_change_id"]) == ([], 5, 5)
+
+    monkeypatch.setattr(app, "MAX_CHANGES_LIMIT", 2)
+    body = client.get("/changes", params={"since": 0, "limit": 1000}).json()
+    assert [change["change_id"] for change in body["changes"]] == [1, 2]
+    assert body["last_change_id"] == 2
+
+
+@pytest.mark.parametrize("params, status_code", [
+    ({"limit": 0}, 400),
+    ({"limit": -1}, 400),
+    ({"since": 99}, 410),
+])
+def test_changes_endpoint_rejects_bad_cursors(client, params, status_code):
+    assert client.get("/changes", params=params).status_code == status_code
+
+
+def test_stream_rejects_cursor_beyond_head(client):
+    assert client.get("/changes/stream", params={"since": 99}).status_code == 410
+    assert client.get("/changes/stream", headers={"Last-Event-ID": "99"}).status_code == 410
+
+
+def test_stream_sends_backlog_then_live_changes(app):
+    # TestClient buffers whole bodies, so the endless event stream is driven directly
+    async def scenario():
+        broadcaster = app.change_broadcaster
+        await broadcaster.start()
+        request = Request({"type": "http", "method": "GET", "path": "/changes/stream", "headers": [], "query_string": b""})
+        response = await app.stream_changes(request, since=1)
+        events = response.body_iterator
+
+        backlog = await asyncio.wait_for(anext(events), 5)
+        assert backlog.startswith("id: 2\nevent: customers\n")
+        assert len(broadcaster._subscribers) == 1
+
+        await asyncio.to_thread(DB.products_insert_one, "kiwi", 2.0, 1, 41.6, 41.6, "fruit", "kiwi", None, 1)
+        live = await asyncio.wait_for(anext(events), 5)
+        assert live.startswith("id: 3\nevent: products\n")
+
+        await events.aclose()
+        assert not broadcaster._subscribers
+        await broadcaster.stop()
+
+    asyncio.run(scenario())
+
+
+def test_broadcaster_queries_once_per_tick_for_all_subscribers(db, monkeypatch):
+    calls = []
+
+    def counting_changes_get(since: int, limit: int):
+        calls.append(since)
+        return DB.changes_get(since, limit)
+
+    monkeypatch.setattr(changefeed, "changes_get", counting_changes_get)
+
+    async def scenario():
+        broadcaster = ChangeBroadcaster()
+        broadcaster.last_change_id = 0
+        queues = [broadcaster.subscribe() for _ in range(50)]
+        await broadcaster.poll()
+        return queues
+
+    queues = asyncio.run(scenario())
+    assert calls == [0]
+    assert all(queue.qsize() == 2 for queue in queues)
+
+
+def test_broadcaster_closes_subscribers_that_fall_behind(db):
+    DB.products_insert_many([("kiwi", 1.0, 1, 41.6, 41.6, "fruit", "kiwi", None, 1)] * 3)
+
+    async def scenario():
+        broadcaster = ChangeBroadcaster(queue_size=2)
+        queue = broadcaster.subscribe()
+        broadcaster.last_change_id = 2
+        await broadcaster.poll()
+        assert not broadcaster._subscribers
+        assert [queue.get_nowait() for _ in range(queue.qsize())] == [None]
+
+    asyncio.run(scenario())
+
+
+def test_idle_broadcaster_does_not_skip_past_a_new_subscriber(db, monkeypatch):
+    async def scenario():
+        broadcaster = ChangeBroadcaster()
+
+        def bounds_after_subscribe():
+            # the stream subscribes while the idle poll is reading the head
+            broadcaster.subscribe()
+            DB.products_insert_one("kiwi", 2.0, 1, 41.6, 41.6, "fruit", "kiwi", None, 1)
+            return DB.changes_get_bounds()
+
+        monkeypatch.setattr(changefeed, "changes_get_bounds", bounds_after_subscribe)
+        await broadcaster.poll()
+        assert broadcaster.last_change_id == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,53 @@
+import json
+
+import DB
+
+
+def test_changes_record_every_mutation_in_order(db):
+    DB.products_insert_one("honey", 12.0, 4, 42.3, 43.0, "honey", "honey", None, 1)
+    DB.products_update_many("owner_id = ?", (1,), price=11.5)
+    DB.products_delete_one(1)
+    DB.customers_update_one(2, email="farm@two.ge")
+
+    changes = DB.changes_get(0)
+    assert [(table_name, row_id, operation) for _, table_name, row_id, operation, _, _ in changes] == [
+        ("customers", 1, "insert"),
+        ("customers", 2, "insert"),
+        ("products", 1, "insert"),
+        ("products", 1, "update"),
+        ("products", 1, "delete"),
+        ("customers", 2, "update"),
+    ]
+    assert json.loads(changes[3][4])["price"] == 11.5
+    assert changes[4][4] is None
+    assert [change[0] for change in changes] == sorted(change[0] for change in changes)
+
+
+def test_changes_retention_keeps_newest_entries(db, monkeypatch):
+    monkeypatch.setattr(DB, "CHANGES_RETAINED", 2)
+    DB.create_database()
+
+    DB.products_insert_many([("milk", 1.2, 1, 41.6, 41.6, "dairy", "milk", None, 1)] * 3)
+    assert DB.changes_get_bounds() == (5, 4)
+    assert [change[0] for change in DB.changes_get(0)] == [4, 5]
+
+    # lowering the cap trims the backlog at startup, without waiting for the next write
+    monkeypatch.setattr(DB, "CHANGES_RETAINED", 1)
+    DB.create_database()
+    assert DB.changes_get_bounds() == (5, 5)
+    assert DB.changes_head() == 5
+
+
+def test_product_changes_get_returns_current_state_once_per_product(db):
+    DB.products_insert_many([("apple", 2.0, 5, 42.2, 42.7, "fruit", "apple", None, 2)] * 2)
+    head = DB.changes_head()
+
+    DB.products_update_one(1, price=2.5)
+    DB.products_update_one(1, stock_quantity=9)
+    DB.products_delete_one(2)
+
+    new_head, oldest, changes = DB.product_changes_get(head)
+    assert (new_head, oldest) == DB.changes_get_bounds()
+    rows = {row[0]: row[1:] for row in changes}
+    assert rows[1][:2] == (2.5, 9)
+    assert rows[2] == (None,) * 7
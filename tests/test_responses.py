@@ -0,0 +1,45 @@
+import json
+import math
+
+import msgpack
+import pytest
+from starlette.requests import Request
+
+import responses
+
+
+def request_with_accept(accept: str = None) -> Request:
+    headers = [(b"accept", accept.encode())] if accept is not None else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+
+@pytest.mark.parametrize("accept, media_type", [
+    (None, "application/json"),
+    ("*/*", "application/json"),
+    ("application/json", "application/json"),
+    ("application/msgpack", "application/msgpack"),
+    ("Application/MsgPack", "application/msgpack"),
+    ("application/msgpack;q=0", "application/json"),
+    ("application/msgpack;q=0.5, application/json", "application/json"),
+    ("application/json;q=0.5, application/msgpack", "application/msgpack"),
+    ("application/*;q=0.2, application/msgpack;q=0.9", "application/msgpack"),
+    ("application/*, application/msgpack;q=0", "application/json"),
+])
+def test_negotiate_honours_accept_quality(accept, media_type):
+    response = responses.negotiate(request_with_accept(accept), {"products": [(1, "tomato", 2.5)]})
+    assert response.media_type == media_type
+    assert response.headers["vary"] == "Accept"
+    if media_type == "application/msgpack":
+        assert msgpack.unpackb(response.body) == {"products": [[1, "tomato", 2.5]]}
+    else:
+        assert json.loads(response.body) == {"products": [[1, "tomato", 2.5]]}
+
+
+@pytest.mark.parametrize("use_orjson", [True, False])
+def test_json_writes_non_finite_floats_as_null(monkeypatch, use_orjson):
+    if use_orjson:
+        pytest.importorskip("orjson")
+    else:
+        monkeypatch.setattr(responses, "orjson", None)
+    assert responses.dumps_json({"price": 2.5}) == b'{"price":2.5}'
+    assert responses.dumps_json({"products": [(1, math.nan)], "min": math.inf, "max": -math.inf}) == b'{"products":[[1,null]],"min":null,"max":null}'
@@ -0,0 +1,154 @@
+import os
+import sqlite3
+import time
+
+import pytest
+
+import DB
+from catalog import CatalogSnapshot
+from storage import ReplicaSQLiteStorage, SQLiteStorage, fcntl, storage_from_url
+
+
+@pytest.mark.parametrize("url, path", [
+    ("store.db", "store.db"),
+    ("sqlite:///store.db", "store.db"),
+    ("sqlite:///data/store.db", "data/store.db"),
+    ("sqlite:////var/lib/agrolink/store.db", "/var/lib/agrolink/store.db"),
+])
+def test_storage_from_url_single_file(url, path):
+    storage = storage_from_url(url)
+    assert type(storage) is SQLiteStorage
+    assert storage.path == path
+
+
+def test_storage_from_url_replica():
+    storage = storage_from_url("sqlite+replica:////srv/store.db?replica=/tmp/local.db&sync_seconds=2.5")
+    assert isinstance(storage, ReplicaSQLiteStorage)
+    assert (storage.path, storage.replica_path, storage.sync_seconds) == ("/srv/store.db", "/tmp/local.db", 2.5)
+
+    storage = storage_from_url("sqlite+replica:///data/store.db")
+    assert (storage.replica_path, storage.sync_seconds) == ("data/store.replica.db", 5.0)
+
+
+def test_storage_from_url_rejects_unknown_scheme():
+    with pytest.raises(ValueError):
+        storage_from_url("postgres://localhost/store")
+
+
+def count_rows(con: sqlite3.Connection) -> int:
+    return con.execute("SELECT COUNT(*) FROM t").fetchone()[0]
+
+
+def age(path: str, seconds: float):
+    past = time.time() - seconds
+    os.utime(path, (past, past))
+
+
+@pytest.fixture
+def replica(tmp_path):
+    primary = tmp_path / "store.db"
+    with sqlite3.connect(primary) as con:
+        con.execute("CREATE TABLE t (x INTEGER)")
+        con.execute("INSERT INTO t VALUES (1)")
+    return ReplicaSQLiteStorage(str(primary), replica_path=str(tmp_path / "local" / "store.replica.db"), sync_seconds=60)
+
+
+def test_replica_resyncs_only_when_old_and_primary_changed(replica):
+    os.makedirs(os.path.dirname(replica.replica_path))
+    assert replica.is_stale()
+    assert replica.sync_if_stale()
+    assert not replica.sync_if_stale()
+    assert replica.replica_version() == replica.primary_version()
+
+    with replica.connect() as con:
+        con.execute("INSERT INTO t VALUES (2)")
+    assert not replica.is_stale()
+
+    # old, and the primary's mtime is even older, but its content changed since the copy
+    age(replica.replica_path, 90)
+    age(replica.path, 3600)
+    assert replica.replica_version() != replica.primary_version()
+    assert replica.sync_if_stale()
+    with sqlite3.connect(replica.replica_path) as con:
+        assert count_rows(con) == 2
+
+    # old, the primary touched just now, but nothing written since the copy
+    age(replica.replica_path, 90)
+    os.utime(replica.path)
+    assert not replica.is_stale()
+
+
+def test_replica_swap_keeps_open_readers_on_their_snapshot(replica, monkeypatch):
+    os.makedirs(os.path.dirname(replica.replica_path))
+    replica.sync()
+    monkeypatch.setattr(replica, "start", lambda: None)
+
+    reader = replica.connect_read()
+    with replica.connect() as con:
+        con.execute("INSERT INTO t VALUES (2)")
+    replica.sync()
+
+    assert count_rows(reader) == 1
+    assert count_rows(replica.connect_read()) == 2
+    with pytest.raises(sqlite3.OperationalError):
+        replica.connect_read().execute("INSERT INTO t VALUES (3)")
+
+
+def test_replica_reads_fall_back_to_primary_before_first_sync(replica, monkeypatch):
+    monkeypatch.setattr(replica, "start", lambda: None)
+    assert count_rows(replica.connect_read()) == 1
+    assert not os.path.exists(replica.replica_path)
+
+
+@pytest.mark.skipif(fcntl is None, reason="needs fcntl.flock")
+def test_replica_sync_skipped_while_another_worker_holds_the_lock(replica):
+    os.makedirs(os.path.dirname(replica.replica_path))
+    with open(replica.lock_path, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        assert not replica.sync_if_stale()
+    assert not os.path.exists(replica.replica_path)
+    assert replica.sync_if_stale()
+
+
+def test_replica_background_thread_picks_up_writes(replica):
+    os.makedirs(os.path.dirname(replica.replica_path))
+    replica.sync_seconds = 0.05
+    replica.start()
+    try:
+        with replica.connect() as con:
+            con.execute("INSERT INTO t VALUES (2)")
+        deadline = time.time() + 5
+        while count_rows(replica.connect_read()) != 2:
+            assert time.time() < deadline
+            time.sleep(0.05)
+    finally:
+        replica.stop()
+
+
+def test_point_lookups_bypass_stale_replica(db, monkeypatch):
+    storage = ReplicaSQLiteStorage("store.db", sync_seconds=3600)
+    monkeypatch.setattr(storage, "start", lambda: None)
+    storage.sync()
+    monkeypatch.setattr(DB, "_storage", storage)
+
+    DB.products_insert_one("plum", 2.2, 4, 42.0, 44.0, "fruit", "plum", None, 1)
+    assert DB.products_get_one(1)[1] == "plum"
+    assert DB.customers_get_one(1)[1] == "farmer one"
+    assert DB.products_get_many() == []
+
+
+def test_change_feed_reads_primary_while_listings_stay_on_replica(db, monkeypatch):
+    storage = ReplicaSQLiteStorage("store.db", sync_seconds=3600)
+    monkeypatch.setattr(storage, "start", lambda: None)
+    storage.sync()
+    monkeypatch.setattr(DB, "_storage", storage)
+
+    DB.products_insert_one("plum", 2.2, 4, 42.0, 44.0, "fruit", "plum", None, 1)
+    assert DB.changes_get_bounds() == (3, 1)
+    assert [change[0] for change in DB.changes_get(2)] == [3]
+
+    # listings and the catalog report the head their replica rows are current up to
+    assert DB.changes_head() == 2
+    snapshot = CatalogSnapshot()
+    snapshot.refresh()
+    assert (snapshot.revision, len(snapshot)) == (2, 0)
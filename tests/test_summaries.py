@@ -0,0 +1,88 @@
+import random
+import sqlite3
+
+import DB
+
+
+def owner_stats_from_products():
+    with sqlite3.connect("store.db") as con:
+        return con.execute(f"""
+            SELECT owner_id, category, COUNT(*), SUM(stock_quantity), SUM({DB._cents('price')} * stock_quantity), SUM({DB._cents('price')}), MIN(price), MAX(price)
+            FROM products GROUP BY owner_id, category ORDER BY owner_id, category
+        """).fetchall()
+
+
+def item_stats_from_products():
+    with sqlite3.connect("store.db") as con:
+        return con.execute(f"""
+            SELECT item, {DB._geo_cell('latitude', 90)}, {DB._geo_cell('longitude', 180)}, COUNT(*), SUM(stock_quantity), SUM({DB._cents('price')}), MIN(price)
+            FROM products GROUP BY 1, 2, 3 ORDER BY 1, 2, 3
+        """).fetchall()
+
+
+def assert_stats_match():
+    with sqlite3.connect("store.db") as con:
+        owner_stats = con.execute("SELECT * FROM owner_category_stats ORDER BY owner_id, category").fetchall()
+        item_stats = con.execute("SELECT * FROM item_region_stats ORDER BY item, lat_cell, lon_cell").fetchall()
+    assert owner_stats == owner_stats_from_products()
+    assert item_stats == item_stats_from_products()
+
+
+def test_stats_follow_updates_that_move_rows_between_groups(db):
+    DB.products_insert_many([
+        ("tomato", 2.10, 10, 41.9, 44.8, "vegetables", "tomato", None, 1),
+        ("tomato", 1.90, 5, 41.9, 44.8, "vegetables", "tomato", None, 1),
+        ("apple", 3.30, 7, 42.2, 42.7, "fruit", "apple", None, 2),
+    ])
+    assert_stats_match()
+
+    DB.products_update_one(1, category="fruit")
+    DB.products_update_one(2, owner_id=2, latitude=42.3)
+    DB.products_update_one(3, item="pear", price=4.05, stock_quantity=3)
+    DB.products_update_many("owner_id = ?", (2,), longitude=45.6)
+    assert_stats_match()
+
+
+def test_stats_recompute_extremes_when_min_or_max_row_is_deleted(db):
+    DB.products_insert_many([
+        ("cheese", price, 1, 41.7, 44.7, "dairy", "cheese", None, 1) for price in (5.0, 7.5, 9.25)
+    ])
+
+    DB.products_delete_one(1)
+    assert DB.owner_stats_get(1) == [("dairy", 2, 2, 16.75, 8.38, 7.5, 9.25)]
+    DB.products_delete_one(3)
+    assert DB.owner_stats_get(1) == [("dairy", 1, 1, 7.5, 7.5, 7.5, 7.5)]
+    assert_stats_match()
+
+    DB.products_delete_one(2)
+    assert DB.owner_stats_get(1) == []
+    assert DB.item_price_stats_get("cheese") == []
+
+
+def test_stats_match_group_by_after_random_mutations(db):
+    rng = random.Random(7)
+
+    def random_product():
+        return ("p", round(rng.uniform(0.5, 20), 2), rng.randint(1, 50), rng.uniform(41, 42), rng.uniform(44, 45), rng.choice(["fruit", "dairy"]), rng.choice(["apple", "milk"]), None, rng.randint(1, 2))
+
+    DB.products_insert_many([random_product() for _ in range(100)])
+    for _ in range(300):
+        product_ids = [row[0] for row in DB.products_get_many()]
+        roll = rng.random()
+        if roll < 0.3:
+            DB.products_insert_one(*random_product())
+        elif roll < 0.6:
+            DB.products_delete_one(rng.choice(product_ids))
+        else:
+            DB.products_update_one(rng.choice(product_ids), price=round(rng.uniform(0.5, 20), 2), category=rng.choice(["fruit", "dairy", "honey"]), latitude=rng.uniform(41, 42))
+    assert_stats_match()
+
+
+def test_summaries_rebuild_matches_triggers(db):
+    DB.products_insert_many([("milk", 1.15, 3, 41.6, 41.6, "dairy", "milk", None, 2)] * 3)
+    DB.products_update_one(2, price=1.35)
+    with sqlite3.connect("store.db") as con:
+        before = con.execute("SELECT * FROM owner_category_stats").fetchall()
+    DB.summaries_rebuild()
+    with sqlite3.connect("store.db") as con:
+        assert con.execute("SELECT * FROM owner_category_stats").fetchall() == before